@@ -7,9 +7,17 @@ import numpy as np
 from pathlib import Path
 from datetime import datetime
 import json
+import re
 import time
 import threading
-from queue import Queue, Empty
+import socket
+import hmac
+import math
+import itertools
+import urllib.request
+import urllib.error
+from urllib.parse import urlsplit
+from queue import Queue, Empty, Full
 from collections import deque
 
 app = Flask(__name__)
@@ -44,6 +52,7 @@ def get_model_for_camera(camera_id):
 camera_data = {}
 camera_threads = {}
 camera_locks = {}
+camera_traced_locks = {}  # camera_id -> TracedLock around camera_locks[camera_id], see camera_lock()
 camera_stop_events = {}  # Use threading.Event for clean shutdown
 global_activity_logs = deque(maxlen=500)
 TRACK_TIMEOUT = 3.0
@@ -52,9 +61,33 @@ TRACK_LOST_TIMEOUT = 1.0
 # FPS reporting control
 SHOW_FPS_IN_TERMINAL = False
 
+# Multi-node deployment
+# standalone: cameras + global logic + dashboard in one process (default)
+# worker:     runs WORKER_CAMERAS and publishes per-frame counts to the aggregator
+# aggregator: merges worker counts into the global ENTER/EXIT logic and proxies streams
+NODE_MODE = os.environ.get('NODE_MODE', 'standalone')
+NODE_ID = os.environ.get('NODE_ID', socket.gethostname())
+PORT = int(os.environ.get('PORT', 5001))
+AGGREGATOR_ADDRESS = os.environ.get('AGGREGATOR_ADDRESS', 'tcp://127.0.0.1:6001')
+WORKER_CAMERAS = [int(c) for c in os.environ.get('WORKER_CAMERAS', '').split(',') if c.strip()]
+WORKER_HTTP_URL = os.environ.get('WORKER_HTTP_URL', f'http://{NODE_ID}:{PORT}')
+NODE_SECRET = os.environ.get('NODE_SECRET', '')  # shared by workers and the aggregator
+# Hosts the aggregator may proxy to; empty allows any http(s) host
+WORKER_HOST_ALLOWLIST = {h.strip() for h in os.environ.get('WORKER_HOST_ALLOWLIST', '').split(',') if h.strip()}
+REMOTE_CAMERA_TIMEOUT = 3.0  # seconds without a message before a remote camera counts as stopped
+
+# Trace flight recorder (per-frame span timings, exported at /get_trace)
+TRACE_BUFFER_SIZE = 100000  # spans kept in the ring buffer, oldest dropped first
+LOCK_WAIT_THRESHOLD = 0.00003  # seconds; shorter (uncontended) lock waits are not recorded
+trace_enabled = os.environ.get('TRACE_ENABLED', '1') != '0'
+
 def init_camera_data(camera_id):
     """Initialize data for a specific camera if not exists"""
     if camera_id not in camera_data:
+        # Lock first: other threads iterate camera_data and expect a lock for every key
+        camera_locks[camera_id] = threading.Lock()
+        camera_traced_locks[camera_id] = TracedLock(camera_locks[camera_id], f"camera_locks[{camera_id}]")
+        camera_stop_events[camera_id] = threading.Event()
         camera_data[camera_id] = {
             'polygon_points': [],
             'objects_in_zone': {},
@@ -65,10 +98,9 @@ def init_camera_data(camera_id):
             'fps': 0,
             'total_detections': 0,
             'cap': None,
-            'track_states': {}
+            'track_states': {},
+            'remote': None  # {'node', 'camera', 'url', 'last_message'} for cameras on worker nodes
         }
-        camera_locks[camera_id] = threading.Lock()
-        camera_stop_events[camera_id] = threading.Event()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -101,6 +133,103 @@ def get_box_center(box):
     x1, y1, x2, y2 = box
     return ((x1 + x2) / 2, (y1 + y2) / 2)
 
+# ===== TRACE FLIGHT RECORDER =====
+trace_buffer = deque(maxlen=TRACE_BUFFER_SIZE)  # (name, tid, thread_name, start, end, args)
+trace_epoch = time.perf_counter()
+trace_thread = threading.local()  # Per-thread trace row: .tid and the .name it was assigned for
+trace_tid_counter = itertools.count(1)
+
+def record_span(name, start, end, args=None):
+    """Append one finished span; deque.append is atomic so no lock is needed"""
+    # OS thread idents get reused (Werkzeug starts a thread per request), so every
+    # thread - and every rename of a thread - gets its own trace row id
+    thread_name = threading.current_thread().name
+    if getattr(trace_thread, 'name', None) != thread_name:
+        trace_thread.tid = next(trace_tid_counter)
+        trace_thread.name = thread_name
+    trace_buffer.append((name, trace_thread.tid, thread_name, start, end, args))
+
+class TraceSpan:
+    """Time a block into the flight recorder: `with TraceSpan('inference', camera_id):`"""
+    __slots__ = ('name', 'camera_id', 'start')
+
+    def __init__(self, name, camera_id=None):
+        self.name = name
+        self.camera_id = camera_id
+        self.start = None
+
+    def __enter__(self):
+        if trace_enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            args = {'camera': self.camera_id} if self.camera_id is not None else None
+            record_span(self.name, self.start, time.perf_counter(), args)
+        return False
+
+class TracedLock:
+    """
+    Acquire a lock, recording waits longer than LOCK_WAIT_THRESHOLD as 'lock_wait' spans.
+    Holds no per-acquire state, so one instance can be shared by all threads.
+    """
+    __slots__ = ('lock', 'args')
+
+    def __init__(self, lock, label):
+        self.lock = lock
+        self.args = {'lock': label}
+
+    def __enter__(self):
+        if not trace_enabled:
+            self.lock.acquire()
+            return self
+        start = time.perf_counter()
+        self.lock.acquire()
+        end = time.perf_counter()
+        if end - start > LOCK_WAIT_THRESHOLD:
+            record_span('lock_wait', start, end, self.args)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+def camera_lock(camera_id):
+    return camera_traced_locks[camera_id]
+
+def export_chrome_trace(seconds):
+    """Build a Chrome/Perfetto trace (JSON object format) from the last `seconds` of spans"""
+    spans = list(trace_buffer)
+    cutoff = time.perf_counter() - seconds
+    pid = os.getpid()
+    events = [{
+        'name': 'process_name', 'ph': 'M', 'pid': pid,
+        'args': {'name': f"{NODE_ID} ({NODE_MODE})"}
+    }]
+    thread_names = {}
+
+    for name, tid, thread_name, start, end, args in spans:
+        if end < cutoff:
+            continue
+        thread_names[tid] = thread_name
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - trace_epoch) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': pid,
+            'tid': tid
+        }
+        if args:
+            event['args'] = args
+        events.append(event)
+
+    for tid, thread_name in thread_names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
 def process_camera_stream(camera_index, confidence=0.25):
     camera_id = str(camera_index)
     init_camera_data(camera_id)
@@ -112,8 +241,10 @@ def process_camera_stream(camera_index, confidence=0.25):
     cap = cv2.VideoCapture(camera_index)
     if not cap.isOpened():
         print(f"❌ [Camera {camera_id}] Failed to open")
-        with camera_locks[camera_id]:
+        with camera_lock(camera_id):
             camera_data[camera_id]['is_running'] = False
+        if NODE_MODE == 'worker':
+            publish_camera_update(camera_id, False)
         return
 
     cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
@@ -121,7 +252,7 @@ def process_camera_stream(camera_index, confidence=0.25):
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
     cap.set(cv2.CAP_PROP_FPS, 30)
 
-    with camera_locks[camera_id]:
+    with camera_lock(camera_id):
         camera_data[camera_id]['cap'] = cap
         camera_data[camera_id]['is_running'] = True
 
@@ -134,7 +265,10 @@ def process_camera_stream(camera_index, confidence=0.25):
 
     while not camera_stop_events[camera_id].is_set():
         try:
-            ret, frame = cap.read()
+            frame_start = time.perf_counter()
+
+            with TraceSpan('cap.read', camera_id):
+                ret, frame = cap.read()
             if not ret:
                 print(f"⚠️  [Camera {camera_id}] Failed to read frame")
                 time.sleep(0.05)
@@ -146,67 +280,66 @@ def process_camera_stream(camera_index, confidence=0.25):
             prev_time = now
 
             # YOLO DETECTION (NO TRACKING)
-            results = model(frame, conf=confidence, verbose=False)
+            with TraceSpan('inference', camera_id):
+                results = model(frame, conf=confidence, verbose=False)
             result = results[0]
-            annotated_frame = result.plot()
+            with TraceSpan('result.plot', camera_id):
+                annotated_frame = result.plot()
 
             # Get polygon
-            with camera_locks[camera_id]:
+            with camera_lock(camera_id):
                 polygon_points = camera_data[camera_id]['polygon_points'].copy()
 
             safe_points = [[int(p[0]), int(p[1])] for p in polygon_points] if len(polygon_points) >= 3 else []
 
-            # Draw polygon
-            if len(safe_points) >= 3:
-                pts = np.array(safe_points, np.int32).reshape((-1, 1, 2))
-                overlay = annotated_frame.copy()
-                cv2.fillPoly(overlay, [pts], (0, 255, 0))
-                cv2.addWeighted(overlay, 0.25, annotated_frame, 0.75, 0, annotated_frame)
-                cv2.polylines(annotated_frame, [pts], True, (0, 255, 0), 2)
-
-            # PURE DETECTION + POLYGON LOGIC
-            class_counts_local = {}
-            total_detections = 0
-
-            if result.boxes is not None:
-                total_detections = len(result.boxes)
-
-                for box in result.boxes:
-                    bbox = box.xyxy[0].tolist()
-                    center = get_box_center(bbox)
-                    class_name = result.names[int(box.cls[0])]
-
-                    if len(safe_points) >= 3 and point_in_polygon(center, safe_points):
-                        class_counts_local[class_name] = (
-                            class_counts_local.get(class_name, 0) + 1
-                        )
-
-                        cv2.circle(
-                            annotated_frame,
-                            (int(center[0]), int(center[1])),
-                            5,
-                            (0, 255, 0),
-                            -1
-                        )
+            with TraceSpan('zone_logic', camera_id):
+                # Draw polygon
+                if len(safe_points) >= 3:
+                    pts = np.array(safe_points, np.int32).reshape((-1, 1, 2))
+                    overlay = annotated_frame.copy()
+                    cv2.fillPoly(overlay, [pts], (0, 255, 0))
+                    cv2.addWeighted(overlay, 0.25, annotated_frame, 0.75, 0, annotated_frame)
+                    cv2.polylines(annotated_frame, [pts], True, (0, 255, 0), 2)
+
+                # PURE DETECTION + POLYGON LOGIC
+                class_counts_local = {}
+                total_detections = 0
+
+                if result.boxes is not None:
+                    total_detections = len(result.boxes)
+
+                    for box in result.boxes:
+                        bbox = box.xyxy[0].tolist()
+                        center = get_box_center(bbox)
+                        class_name = result.names[int(box.cls[0])]
+
+                        if len(safe_points) >= 3 and point_in_polygon(center, safe_points):
+                            class_counts_local[class_name] = (
+                                class_counts_local.get(class_name, 0) + 1
+                            )
+
+                            cv2.circle(
+                                annotated_frame,
+                                (int(center[0]), int(center[1])),
+                                5,
+                                (0, 255, 0),
+                                -1
+                            )
 
             # Store per-camera data (UI only)
-            with camera_locks[camera_id]:
+            with camera_lock(camera_id):
                 camera_data[camera_id]['objects_in_zone'] = class_counts_local
                 camera_data[camera_id]['fps'] = fps
                 camera_data[camera_id]['total_detections'] = total_detections
                 camera_data[camera_id]['latest_frame'] = annotated_frame.copy()
 
-            # GLOBAL AGGREGATION - MAX LOGIC
-            global_class_counts = {}
-
-            for cam_id in camera_data.keys():
-                with camera_locks[cam_id]:
-                    if camera_data[cam_id]['is_running']:
-                        cam_counts = camera_data[cam_id].get('objects_in_zone', {})
-                        for cls, cnt in cam_counts.items():
-                            global_class_counts[cls] = max(global_class_counts.get(cls, 0), cnt)
-
-            update_global_class_state(global_class_counts)
+            # GLOBAL AGGREGATION - MAX LOGIC (done by the aggregator when running as a worker)
+            if NODE_MODE == 'worker':
+                with TraceSpan('publish', camera_id):
+                    publish_camera_update(camera_id, True, fps, total_detections, class_counts_local)
+            else:
+                with TraceSpan('global_aggregate', camera_id):
+                    aggregate_global_counts()
 
             # Info overlay
             info = f"Cam {camera_id} | InZone: {sum(class_counts_local.values())} | Total: {total_detections}"
@@ -220,18 +353,24 @@ def process_camera_stream(camera_index, confidence=0.25):
                 2
             )
 
+            if trace_enabled:
+                record_span('frame', frame_start, time.perf_counter(), {'camera': camera_id})
+
         except Exception as e:
             print(f"❌ [Camera {camera_id}] Error: {e}")
             time.sleep(0.05)
 
     # Clean shutdown
     cap.release()
-    with camera_locks[camera_id]:
+    with camera_lock(camera_id):
         camera_data[camera_id]['cap'] = None
         camera_data[camera_id]['is_running'] = False
         camera_data[camera_id]['latest_frame'] = None
         camera_data[camera_id]['objects_in_zone'] = {}  # Clear detections
 
+    if NODE_MODE == 'worker':
+        publish_camera_update(camera_id, False)
+
     print(f"🛑 [Camera {camera_id}] Processing stopped cleanly")
 
 @app.route('/')
@@ -274,12 +413,17 @@ def start_all_cameras():
             camera_threads[camera_id].join(timeout=2.0)
         
         print(f"▶️  [Camera {camera_id}] Starting new thread...")
-        thread = threading.Thread(target=process_camera_stream, args=(cam_idx, confidence), daemon=True)
+        thread = threading.Thread(target=process_camera_stream, args=(cam_idx, confidence), name=f"camera-{camera_id}", daemon=True)
         camera_threads[camera_id] = thread
         thread.start()
         started_cameras.append(cam_idx)
         time.sleep(0.5)
     
+    for camera_id in remote_camera_ids():
+        result = proxy_to_worker(camera_id, '/start_camera', {'confidence': confidence})
+        if result.get('success') or result.get('message') == 'Camera already running':
+            started_cameras.append(camera_id)
+    
     print(f"✅ Started {len(started_cameras)} camera(s): {started_cameras}")
     print(f"{'='*50}\n")
     
@@ -290,6 +434,9 @@ def stop_all_cameras():
     """Stop all running cameras"""
     print(f"\n🛑 Stopping all cameras...")
     
+    for camera_id in remote_camera_ids():
+        proxy_to_worker(camera_id, '/stop_camera', {})
+    
     for camera_id in list(camera_data.keys()):
         camera_stop_events[camera_id].set()
         
@@ -305,10 +452,17 @@ def stop_all_cameras():
 def start_camera():
     """Start a specific camera"""
     data = request.json
-    camera_index = int(data.get('camera_id', 0))
-    camera_id = str(camera_index)
+    camera_id = str(data.get('camera_id', 0))
     confidence = float(data.get('confidence', 0.25))
     
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/start_camera', {'confidence': confidence}))
+    
+    try:
+        camera_index = int(camera_id)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Unknown camera'})
+    
     print(f"\n{'='*50}")
     print(f"🎥 Start camera request for Camera {camera_id}")
     
@@ -328,7 +482,7 @@ def start_camera():
         print(f"✅ [Camera {camera_id}] Existing thread stopped")
     
     print(f"▶️  [Camera {camera_id}] Creating new thread...")
-    thread = threading.Thread(target=process_camera_stream, args=(camera_index, confidence), daemon=True)
+    thread = threading.Thread(target=process_camera_stream, args=(camera_index, confidence), name=f"camera-{camera_id}", daemon=True)
     camera_threads[camera_id] = thread
     thread.start()
     
@@ -353,6 +507,9 @@ def stop_camera():
     data = request.json
     camera_id = str(data.get('camera_id', '0'))
     
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/stop_camera', {}))
+    
     if camera_id in camera_data:
         # Signal thread to stop
         camera_stop_events[camera_id].set()
@@ -372,6 +529,9 @@ def pause_camera():
     data = request.json
     camera_id = str(data.get('camera_id', '0'))
     
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/pause_camera', {}))
+    
     if camera_id in camera_data:
         # Signal thread to stop
         camera_stop_events[camera_id].set()
@@ -390,6 +550,9 @@ def set_polygon():
     data = request.json
     camera_id = str(data.get('camera_id', '0'))
     
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/set_polygon', {'points': data.get('points', [])}))
+    
     init_camera_data(camera_id)
     
     with camera_locks[camera_id]:
@@ -405,6 +568,10 @@ def set_polygon():
 @app.route('/get_polygon', methods=['GET'])
 def get_polygon():
     camera_id = str(request.args.get('camera_id', '0'))
+    
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/get_polygon'))
+    
     init_camera_data(camera_id)
     
     with camera_locks[camera_id]:
@@ -417,6 +584,9 @@ def clear_polygon():
     data = request.json
     camera_id = str(data.get('camera_id', '0'))
     
+    if is_remote_camera(camera_id):
+        return jsonify(proxy_to_worker(camera_id, '/clear_polygon', {}))
+    
     init_camera_data(camera_id)
     
     with camera_locks[camera_id]:
@@ -441,7 +611,7 @@ def get_camera_stats():
     """Get stats for all running cameras"""
     stats = {}
     
-    for camera_id in camera_data.keys():
+    for camera_id in list(camera_data.keys()):
         with camera_locks[camera_id]:
             stats[camera_id] = {
                 'is_running': camera_data[camera_id]['is_running'],
@@ -458,7 +628,7 @@ def clear_logs():
     global global_activity_logs
     global_activity_logs.clear()
     
-    for camera_id in camera_data.keys():
+    for camera_id in list(camera_data.keys()):
         with camera_locks[camera_id]:
             camera_data[camera_id]['activity_logs'] = []
     
@@ -469,17 +639,20 @@ def clear_logs():
 @app.route('/video_feed')
 def video_feed():
     """Video streaming route - returns latest frame from requested camera - IMPROVED VERSION"""
-    camera_index = int(request.args.get('camera', 0))
-    camera_id = str(camera_index)
+    camera_id = str(request.args.get('camera', 0))
     
     print(f"📹 Video feed requested for Camera {camera_id}")
     
+    if is_remote_camera(camera_id):
+        return proxy_video_feed(camera_id)
+    
     def generate():
         """Generate frames from camera's latest_frame buffer"""
         last_frame_time = 0
         frame_interval = 0.033  # ~30 fps
         no_frame_count = 0
         max_no_frame_retries = 100  # ~3 seconds at 30fps
+        threading.current_thread().name = f"stream-{camera_id}"  # Label for the trace timeline
         
         while True:
             try:
@@ -494,7 +667,7 @@ def video_feed():
                         break
                     continue
                 
-                with camera_locks[camera_id]:
+                with camera_lock(camera_id):
                     is_running = camera_data[camera_id]['is_running']
                     frame = camera_data[camera_id]['latest_frame']
                 
@@ -515,14 +688,17 @@ def video_feed():
                 no_frame_count = 0
                 
                 if current_time - last_frame_time >= frame_interval:
-                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                    with TraceSpan('jpeg_encode', camera_id):
+                        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
                     if ret:
-                        yield (
-                            b'--frame\r\n'
-                            b'Content-Type: image/jpeg\r\n\r\n' +
-                            buffer.tobytes() +
-                            b'\r\n'
-                        )
+                        # Time blocked handing the frame to the client
+                        with TraceSpan('stream_send', camera_id):
+                            yield (
+                                b'--frame\r\n'
+                                b'Content-Type: image/jpeg\r\n\r\n' +
+                                buffer.tobytes() +
+                                b'\r\n'
+                            )
                         last_frame_time = current_time
                 
                 time.sleep(0.01)
@@ -574,7 +750,7 @@ def list_available_cameras(max_failures=5):
 
 @app.route('/get_cameras')
 def get_cameras():
-    cams = list_available_cameras(5)
+    cams = list_available_cameras(5) + remote_camera_ids()
     print("🎥 Available cameras right now:", cams)
     return jsonify(cams)
 
@@ -587,7 +763,7 @@ def get_system_status():
         'camera_details': {}
     }
     
-    for camera_id in camera_data.keys():
+    for camera_id in list(camera_data.keys()):
         with camera_locks[camera_id]:
             status['camera_details'][camera_id] = {
                 'is_running': camera_data[camera_id]['is_running'],
@@ -619,10 +795,71 @@ def debug_camera(camera_id):
             'stop_event_set': camera_stop_events[camera_id].is_set() if camera_id in camera_stop_events else None
         })
 
+@app.route('/get_trace')
+def get_trace():
+    """Download the last N seconds of the flight recorder as a Chrome/Perfetto trace"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        seconds = -1
+    if not math.isfinite(seconds) or seconds <= 0:
+        return jsonify({'success': False, 'message': 'seconds must be a positive number'}), 400
+
+    trace = export_chrome_trace(seconds)
+
+    response = make_response(json.dumps(trace))
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['Content-Disposition'] = f"attachment; filename=trace_{NODE_ID}_{int(time.time())}.json"
+    return response
+
+@app.route('/set_tracing', methods=['POST'])
+def set_tracing():
+    """Turn span recording on or off at run time"""
+    global trace_enabled
+    data = request.get_json(silent=True) or {}
+    enabled = data.get('enabled')
+    clear = data.get('clear', False)
+    if not isinstance(enabled, bool) or not isinstance(clear, bool):
+        return jsonify({'success': False, 'message': "'enabled' (and 'clear' if given) must be true or false"}), 400
+
+    trace_enabled = enabled
+    if clear:
+        trace_buffer.clear()
+
+    print(f"⏱️  Tracing {'enabled' if trace_enabled else 'disabled'}")
+
+    return jsonify({'success': True, 'enabled': trace_enabled, 'buffered_spans': len(trace_buffer)})
+
 # ===== GLOBAL CLASS-LEVEL STATE =====
 class_global_state = {}
+global_state_lock = threading.Lock()
+global_state_traced_lock = TracedLock(global_state_lock, 'global_state_lock')
 CLASS_EXIT_TIMEOUT = 1.0  # seconds
 
+def aggregate_global_counts():
+    """
+    Take the per-class MAX across all running cameras (local and remote)
+    and feed it into the global ENTER/EXIT logic.
+    """
+    global_class_counts = {}
+    now = time.time()
+
+    for cam_id in list(camera_data.keys()):
+        with camera_lock(cam_id):
+            remote = camera_data[cam_id]['remote']
+            if remote and camera_data[cam_id]['is_running'] and now - remote['last_message'] > REMOTE_CAMERA_TIMEOUT:
+                print(f"⚠️  [Camera {cam_id}] No messages from node {remote['node']}, marking stopped")
+                camera_data[cam_id]['is_running'] = False
+                camera_data[cam_id]['objects_in_zone'] = {}
+
+            if camera_data[cam_id]['is_running']:
+                cam_counts = camera_data[cam_id].get('objects_in_zone', {})
+                for cls, cnt in cam_counts.items():
+                    global_class_counts[cls] = max(global_class_counts.get(cls, 0), cnt)
+
+    with global_state_traced_lock:
+        update_global_class_state(global_class_counts)
+
 def update_global_class_state(class_counts):
     """
     class_counts: dict {class_name: MAX_count_across_all_cameras}
@@ -676,6 +913,375 @@ def update_global_class_state(class_counts):
                 state["max_count"] = 0
 
 
+# ===== MULTI-NODE TRANSPORT =====
+class Transport:
+    """Carries worker -> aggregator messages (plain dicts). Subclass to plug in another transport."""
+
+    def send(self, message):
+        raise NotImplementedError
+
+    def serve(self, handler):
+        """Deliver every received message to handler(message) from a background thread"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessTransport(Transport):
+    """Queue-backed stand-in for running workers and the aggregator in one process (tests only)"""
+
+    MAX_QUEUED = 1000  # oldest messages are dropped beyond this
+
+    def __init__(self):
+        self.queue = Queue(maxsize=self.MAX_QUEUED)
+        self.closed = threading.Event()
+
+    def send(self, message):
+        # Round-trip through JSON so messages look exactly like the socket transport's
+        message = json.loads(json.dumps(message))
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return True
+            except Full:
+                try:
+                    self.queue.get_nowait()  # Drop the oldest
+                except Empty:
+                    pass
+
+    def serve(self, handler):
+        def receive_loop():
+            while not self.closed.is_set():
+                try:
+                    message = self.queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                try:
+                    handler(message)
+                except Exception as e:
+                    print(f"❌ Bad worker message: {e}")
+
+        thread = threading.Thread(target=receive_loop, name='transport-receiver', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.closed.set()
+
+
+class SocketTransport(Transport):
+    """
+    Newline-delimited JSON over TCP ('tcp://host:port') or a Unix socket ('unix:///path/to.sock').
+
+    The first line of every connection is {"secret": ...}; the server drops connections
+    whose secret doesn't match. Sending never touches the socket on the caller's thread:
+    messages go into a bounded outbox (oldest dropped first) drained by one sender thread.
+    """
+
+    RECONNECT_INTERVAL = 1.0  # seconds between connection attempts when the aggregator is down
+    CONNECT_TIMEOUT = 1.0
+    HANDSHAKE_TIMEOUT = 5.0  # seconds a new connection gets to send its secret
+    MAX_HANDSHAKE_LENGTH = 1024  # characters in the secret line
+    MAX_QUEUED = 1000  # outbox size; oldest messages are dropped while the aggregator is slow or down
+
+    def __init__(self, address, secret=''):
+        self.address = address
+        self.secret = secret
+        if address.startswith('unix://'):
+            self.family = socket.AF_UNIX
+            self.sockaddr = address[len('unix://'):]
+        elif address.startswith('tcp://'):
+            host, _, port = address[len('tcp://'):].rpartition(':')
+            self.family = socket.AF_INET
+            self.sockaddr = (host, int(port))
+        else:
+            raise ValueError(f"Unsupported transport address: {address}")
+
+        self.sock = None
+        self.server = None
+        self.outbox = deque(maxlen=self.MAX_QUEUED)
+        self.pending = threading.Event()
+        self.closed = threading.Event()
+        self.sender = None
+        self.sender_lock = threading.Lock()
+
+    def send(self, message):
+        """Queue one message for the sender thread; never blocks on the network"""
+        if self.sender is None:
+            with self.sender_lock:
+                if self.sender is None:
+                    self.sender = threading.Thread(target=self._send_loop, name='transport-sender', daemon=True)
+                    self.sender.start()
+
+        self.outbox.append(message)
+        self.pending.set()
+        return True
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.CONNECT_TIMEOUT)
+            sock.connect(self.sockaddr)
+            sock.settimeout(None)  # Only the sender thread blocks on this socket
+            sock.sendall((json.dumps({'secret': self.secret}) + '\n').encode('utf-8'))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _send_loop(self):
+        while not self.closed.is_set():
+            self.pending.wait()
+            self.pending.clear()
+
+            while self.outbox and not self.closed.is_set():
+                if self.sock is None:
+                    try:
+                        self.sock = self._connect()
+                        print(f"🔗 Connected to aggregator at {self.address}")
+                    except OSError as e:
+                        print(f"⚠️  Aggregator {self.address} unreachable: {e}")
+                        # Keep queueing (and dropping the oldest) until the next attempt
+                        self.closed.wait(self.RECONNECT_INTERVAL)
+                        continue
+
+                try:
+                    message = self.outbox.popleft()
+                except IndexError:
+                    break
+
+                try:
+                    self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+                except OSError as e:
+                    print(f"⚠️  Lost connection to aggregator {self.address}: {e}")
+                    self.sock.close()
+                    self.sock = None
+                    self.closed.wait(self.RECONNECT_INTERVAL)
+
+    def serve(self, handler):
+        if self.family == socket.AF_UNIX and os.path.exists(self.sockaddr):
+            os.unlink(self.sockaddr)
+
+        self.server = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.sockaddr)
+        self.server.listen()
+
+        def handle_connection(conn, peer):
+            # Idle or oversized handshakes must not pin a thread forever
+            conn.settimeout(self.HANDSHAKE_TIMEOUT)
+            with conn, conn.makefile('r', encoding='utf-8') as lines:
+                try:
+                    line = lines.readline(self.MAX_HANDSHAKE_LENGTH)
+                    if not line.endswith('\n'):
+                        raise ValueError("handshake line missing or too long")
+                    hello = json.loads(line)
+                    if not hmac.compare_digest(str(hello.get('secret', '')).encode('utf-8'), self.secret.encode('utf-8')):
+                        print(f"🚫 Rejected worker connection from {peer or 'unix socket'}: bad secret")
+                        return
+                except (ValueError, AttributeError, OSError):
+                    print(f"🚫 Rejected worker connection from {peer or 'unix socket'}: bad handshake")
+                    return
+
+                conn.settimeout(None)  # Authenticated workers may go quiet between frames
+
+                try:
+                    for line in lines:
+                        try:
+                            handler(json.loads(line))
+                        except Exception as e:
+                            print(f"❌ Bad worker message: {e}")
+                except OSError as e:
+                    print(f"⚠️  Worker connection dropped: {e}")
+
+        def accept_loop():
+            while True:
+                try:
+                    conn, peer = self.server.accept()
+                except OSError:
+                    break  # Server socket closed
+                peer_name = f"{peer[0]}:{peer[1]}" if isinstance(peer, tuple) else 'unix'
+                threading.Thread(
+                    target=handle_connection, args=(conn, peer), name=f"worker-conn-{peer_name}", daemon=True
+                ).start()
+
+        thread = threading.Thread(target=accept_loop, name='transport-accept', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.closed.set()
+        self.pending.set()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+node_transport = None
+NODE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')  # node ids end up in dashboard HTML
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Refuse 3xx answers so a worker can't bounce the proxy past validate_worker_url"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # urllib then raises HTTPError for the redirect itself
+
+
+worker_opener = urllib.request.build_opener(NoRedirectHandler)
+
+def validate_worker_url(url):
+    """Only proxy to plain http(s) workers, and only to allow-listed hosts when a list is set"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f"Worker URL must be http(s)://host[:port]: {url!r}")
+    if WORKER_HOST_ALLOWLIST and parts.hostname not in WORKER_HOST_ALLOWLIST:
+        raise ValueError(f"Worker host {parts.hostname!r} is not in WORKER_HOST_ALLOWLIST")
+    return f"{parts.scheme}://{parts.netloc}"
+
+def publish_camera_update(camera_id, is_running, fps=0, total_detections=0, objects_in_zone=None):
+    """Worker side: send this frame's compact per-camera counts to the aggregator"""
+    if node_transport is None:
+        return
+
+    node_transport.send({
+        'node': NODE_ID,
+        'camera': camera_id,
+        'url': WORKER_HTTP_URL,
+        'is_running': is_running,
+        'fps': fps,
+        'total_detections': total_detections,
+        'objects_in_zone': objects_in_zone or {}
+    })
+
+def handle_worker_message(message):
+    """Aggregator side: store a worker's counts as camera '<node>:<camera>' and re-run global logic"""
+    node = message['node']
+    if not isinstance(node, str) or not NODE_ID_PATTERN.match(node):
+        raise ValueError(f"Invalid node id: {node!r}")
+    url = validate_worker_url(message['url'])
+    camera = str(int(message['camera']))
+    # Local cameras only report classes they actually see, so drop empty/negative counts
+    objects_in_zone = {str(cls): int(cnt) for cls, cnt in message['objects_in_zone'].items() if int(cnt) > 0}
+    camera_id = f"{node}:{camera}"
+    init_camera_data(camera_id)
+
+    with camera_lock(camera_id):
+        data = camera_data[camera_id]
+        if data['remote'] is None:
+            print(f"🌐 [Camera {camera_id}] Registered from node {node} ({url})")
+        data['remote'] = {
+            'node': node,
+            'camera': camera,
+            'url': url,
+            'last_message': time.time()  # Local clock, so worker clock skew doesn't matter
+        }
+        data['is_running'] = bool(message['is_running'])
+        data['fps'] = float(message['fps'])
+        data['total_detections'] = int(message['total_detections'])
+        data['objects_in_zone'] = objects_in_zone
+
+    with TraceSpan('global_aggregate', camera_id):
+        aggregate_global_counts()
+
+def run_aggregator_ticks(interval=0.5):
+    """Re-run aggregation periodically so EXITs and silent workers are noticed without new messages"""
+    while True:
+        time.sleep(interval)
+        with TraceSpan('global_aggregate'):
+            aggregate_global_counts()
+
+def is_remote_camera(camera_id):
+    return camera_id in camera_data and camera_data[camera_id]['remote'] is not None
+
+def remote_camera_ids():
+    return [cam_id for cam_id in list(camera_data.keys()) if camera_data[cam_id]['remote'] is not None]
+
+def proxy_to_worker(camera_id, path, payload=None):
+    """Forward a camera request to the worker that owns it. GET when payload is None, else POST JSON."""
+    with camera_lock(camera_id):
+        remote = dict(camera_data[camera_id]['remote'])
+
+    if payload is None:
+        req = urllib.request.Request(f"{remote['url']}{path}?camera_id={remote['camera']}")
+    else:
+        req = urllib.request.Request(
+            remote['url'] + path,
+            data=json.dumps(dict(payload, camera_id=remote['camera'])).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+
+    try:
+        with worker_opener.open(req, timeout=5) as response:
+            result = json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f"❌ [Camera {camera_id}] Worker request {path} failed: {e}")
+        return {'success': False, 'message': f"Worker {remote['node']} unreachable"}
+
+    # Report the aggregator-side id back to the dashboard
+    if 'camera_id' in result:
+        result['camera_id'] = camera_id
+    return result
+
+def proxy_video_feed(camera_id):
+    """Relay a worker's MJPEG stream through the aggregator"""
+    with camera_lock(camera_id):
+        remote = dict(camera_data[camera_id]['remote'])
+
+    url = f"{remote['url']}/video_feed?camera={remote['camera']}"
+
+    def generate():
+        threading.current_thread().name = f"proxy-stream-{camera_id}"  # Label for the trace timeline
+        try:
+            with worker_opener.open(url, timeout=5) as upstream:
+                while True:
+                    with TraceSpan('proxy_read', camera_id):
+                        chunk = upstream.read1(65536)
+                    if not chunk:
+                        break
+                    with TraceSpan('stream_send', camera_id):
+                        yield chunk
+        except GeneratorExit:
+            print(f"🛑 Proxied video feed closed for Camera {camera_id}")
+        except (urllib.error.URLError, OSError) as e:
+            print(f"❌ Proxied stream error for camera {camera_id}: {e}")
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+def start_node():
+    """Set up the transport and background threads for NODE_MODE"""
+    global node_transport
+
+    if NODE_MODE == 'standalone':
+        return
+
+    node_transport = SocketTransport(AGGREGATOR_ADDRESS, NODE_SECRET)
+
+    if NODE_MODE == 'aggregator':
+        if not NODE_SECRET:
+            print("⚠️  NODE_SECRET is not set - any host that can reach the transport socket can act as a worker")
+        node_transport.serve(handle_worker_message)
+        threading.Thread(target=run_aggregator_ticks, name='aggregator-ticks', daemon=True).start()
+        print(f"🌐 Aggregator listening for workers on {AGGREGATOR_ADDRESS}")
+    elif NODE_MODE == 'worker':
+        if not NODE_ID_PATTERN.match(NODE_ID):
+            raise ValueError(f"NODE_ID must match {NODE_ID_PATTERN.pattern}: {NODE_ID!r}")
+        print(f"🌐 Worker {NODE_ID} publishing to {AGGREGATOR_ADDRESS} (streams at {WORKER_HTTP_URL})")
+        for cam_idx in WORKER_CAMERAS:
+            camera_id = str(cam_idx)
+            init_camera_data(camera_id)
+            thread = threading.Thread(target=process_camera_stream, args=(cam_idx,), name=f"camera-{camera_id}", daemon=True)
+            camera_threads[camera_id] = thread
+            thread.start()
+    else:
+        raise ValueError(f"Unknown NODE_MODE: {NODE_MODE}")
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🚀 PARALLEL MULTI-CAMERA DETECTION SYSTEM")
@@ -684,5 +1290,8 @@ if __name__ == '__main__':
     print("📦 Dedicated YOLO model per camera")
     print("🎯 No cross-camera interference")
     print("💡 Stable tracking IDs")
+    print(f"🌐 Node mode: {NODE_MODE}")
     print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
\ No newline at end of file
+    start_node()
+    # The reloader would start a second copy of the worker/aggregator threads
+    app.run(debug=True, host='0.0.0.0', port=PORT, threaded=True, use_reloader=(NODE_MODE == 'standalone'))
\ No newline at end of file
@@ -0,0 +1,329 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(autouse=True)
+def transport(monkeypatch):
+    """Worker and aggregator in one process, joined by an InProcessTransport"""
+    app.camera_data.clear()
+    app.camera_locks.clear()
+    app.camera_stop_events.clear()
+    app.class_global_state.clear()
+    app.global_activity_logs.clear()
+
+    transport = app.InProcessTransport()
+    monkeypatch.setattr(app, 'node_transport', transport)
+    monkeypatch.setattr(app, 'NODE_ID', 'door')
+    monkeypatch.setattr(app, 'WORKER_HTTP_URL', 'http://door-host:5001')
+    monkeypatch.setattr(app, 'WORKER_HOST_ALLOWLIST', set())
+    transport.serve(app.handle_worker_message)
+
+    yield transport
+
+    transport.close()
+
+
+def worker_message(**overrides):
+    message = {
+        'node': 'door',
+        'camera': '0',
+        'url': 'http://door-host:5001',
+        'is_running': True,
+        'fps': 25.0,
+        'total_detections': 3,
+        'objects_in_zone': {'person': 2}
+    }
+    message.update(overrides)
+    return message
+
+
+def test_worker_counts_enter_global_state():
+    app.publish_camera_update('0', True, 25.0, 3, {'person': 2})
+
+    assert wait_for(lambda: app.class_global_state.get('person', {}).get('inside'))
+    assert app.camera_data['door:0']['remote']['url'] == 'http://door-host:5001'
+    assert app.camera_data['door:0']['total_detections'] == 3
+
+    log = app.global_activity_logs[-1]
+    assert log['object'] == 'person'
+    assert log['action'] == 'ENTERED'
+    assert log['max_count'] == 2
+
+
+def test_silent_worker_times_out_and_exits(monkeypatch):
+    app.publish_camera_update('0', True, 25.0, 1, {'person': 1})
+    assert wait_for(lambda: app.class_global_state.get('person', {}).get('inside'))
+
+    monkeypatch.setattr(app, 'REMOTE_CAMERA_TIMEOUT', 0.05)
+    monkeypatch.setattr(app, 'CLASS_EXIT_TIMEOUT', 0.05)
+    time.sleep(0.1)
+    app.aggregate_global_counts()
+
+    assert app.camera_data['door:0']['is_running'] is False
+    assert app.class_global_state['person']['inside'] is False
+    assert app.global_activity_logs[-1]['action'] == 'EXITED'
+
+
+def test_worker_stop_message_exits(monkeypatch):
+    monkeypatch.setattr(app, 'CLASS_EXIT_TIMEOUT', 0.0)
+    app.publish_camera_update('0', True, 25.0, 1, {'person': 1})
+    assert wait_for(lambda: app.class_global_state.get('person', {}).get('inside'))
+
+    app.publish_camera_update('0', False)
+
+    assert wait_for(lambda: not app.class_global_state['person']['inside'])
+    assert app.global_activity_logs[-1]['action'] == 'EXITED'
+
+
+@pytest.mark.parametrize('url', ['file:///etc/hostname#', 'gopher://door-host', 'http://'])
+def test_rejects_non_http_worker_url(url):
+    with pytest.raises(ValueError):
+        app.handle_worker_message(worker_message(url=url))
+
+    assert 'door:0' not in app.camera_data
+    assert not app.global_activity_logs
+
+
+@pytest.mark.parametrize('node', ['<img src=x onerror=alert(1)>', "door'", 'door:0', '', 'a' * 65, 5, None])
+def test_rejects_unsafe_node_id(node):
+    with pytest.raises(ValueError):
+        app.handle_worker_message(worker_message(node=node))
+
+    assert not app.camera_data
+    assert not app.global_activity_logs
+
+
+def test_ignores_non_positive_counts():
+    app.handle_worker_message(worker_message(objects_in_zone={'person': 0, 'car': -1, 'dog': 1}))
+
+    assert app.camera_data['door:0']['objects_in_zone'] == {'dog': 1}
+    assert [log['object'] for log in app.global_activity_logs] == ['dog']
+
+
+def test_rejects_host_outside_allowlist(monkeypatch):
+    monkeypatch.setattr(app, 'WORKER_HOST_ALLOWLIST', {'door-host'})
+
+    with pytest.raises(ValueError):
+        app.handle_worker_message(worker_message(url='http://169.254.169.254'))
+
+    app.handle_worker_message(worker_message())
+    assert app.is_remote_camera('door:0')
+
+
+def test_in_process_queue_is_bounded():
+    transport = app.InProcessTransport()
+
+    for i in range(transport.MAX_QUEUED + 10):
+        transport.send({'i': i})
+
+    assert transport.queue.qsize() == transport.MAX_QUEUED
+    assert transport.queue.get_nowait() == {'i': 10}
+
+
+def test_start_node_rejects_inproc(monkeypatch):
+    monkeypatch.setattr(app, 'NODE_MODE', 'worker')
+    monkeypatch.setattr(app, 'AGGREGATOR_ADDRESS', 'inproc://test')
+
+    with pytest.raises(ValueError):
+        app.start_node()
+
+
+def test_start_unknown_camera_id():
+    response = app.app.test_client().post('/start_camera', json={'camera_id': 'door:0'})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'success': False, 'message': 'Unknown camera'}
+
+
+# ===== SocketTransport =====
+def test_socket_transport_round_trip_and_secret(tmp_path):
+    address = f"unix://{tmp_path}/agg.sock"
+    received = []
+    server = app.SocketTransport(address, 's3cret')
+    server.serve(received.append)
+    good = app.SocketTransport(address, 's3cret')
+    bad = app.SocketTransport(address, 'wrong')
+
+    try:
+        for i in range(3):
+            good.send({'i': i})
+            bad.send({'bad': i})
+
+        assert wait_for(lambda: len(received) == 3)
+        time.sleep(0.1)
+        assert received == [{'i': 0}, {'i': 1}, {'i': 2}]
+    finally:
+        good.close()
+        bad.close()
+        server.close()
+
+
+def test_socket_transport_outbox_drops_oldest(tmp_path):
+    client = app.SocketTransport(f"unix://{tmp_path}/missing.sock")
+
+    try:
+        for i in range(client.MAX_QUEUED + 10):
+            assert client.send({'i': i})
+
+        assert len(client.outbox) == client.MAX_QUEUED
+        assert client.outbox[0] == {'i': 10}
+    finally:
+        client.close()
+
+
+def test_socket_transport_reconnects(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.SocketTransport, 'RECONNECT_INTERVAL', 0.05)
+    address = f"unix://{tmp_path}/agg.sock"
+    received = []
+    client = app.SocketTransport(address)
+    server = app.SocketTransport(address)
+
+    try:
+        client.send({'early': True})  # Aggregator not up yet; stays queued
+        time.sleep(0.1)
+        server.serve(received.append)
+
+        assert wait_for(lambda: received == [{'early': True}])
+    finally:
+        client.close()
+        server.close()
+
+
+def test_socket_transport_drops_idle_handshake(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.SocketTransport, 'HANDSHAKE_TIMEOUT', 0.1)
+    path = f"{tmp_path}/agg.sock"
+    server = app.SocketTransport(f"unix://{path}", 's3cret')
+    server.serve(lambda message: None)
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+            idle.settimeout(2.0)
+            idle.connect(path)
+            assert idle.recv(1) == b''  # Server hung up instead of waiting forever
+    finally:
+        server.close()
+
+
+# ===== Aggregator -> worker proxying =====
+class FakeResponse:
+    def __init__(self, body=b'', chunks=()):
+        self.body = body
+        self.chunks = list(chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return self.body
+
+    def read1(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+@pytest.fixture
+def remote_camera():
+    app.handle_worker_message(worker_message(objects_in_zone={}))
+    return 'door:0'
+
+
+def test_proxy_to_worker_posts_to_owning_worker(monkeypatch, remote_camera):
+    requests = []
+
+    def fake_open(req, timeout=None):
+        requests.append(req)
+        return FakeResponse(json.dumps({'success': True, 'camera_id': '0'}).encode('utf-8'))
+
+    monkeypatch.setattr(app.worker_opener, 'open', fake_open)
+
+    result = app.proxy_to_worker(remote_camera, '/set_polygon', {'points': []})
+
+    assert result == {'success': True, 'camera_id': 'door:0'}
+    assert requests[0].full_url == 'http://door-host:5001/set_polygon'
+    assert json.loads(requests[0].data) == {'points': [], 'camera_id': '0'}
+
+
+def test_proxy_to_worker_unreachable(monkeypatch, remote_camera):
+    def fake_open(req, timeout=None):
+        raise urllib.error.URLError('connection refused')
+
+    monkeypatch.setattr(app.worker_opener, 'open', fake_open)
+
+    assert app.proxy_to_worker(remote_camera, '/get_polygon')['success'] is False
+
+
+def test_video_feed_relays_worker_stream(monkeypatch, remote_camera):
+    urls = []
+
+    def fake_open(url, timeout=None):
+        urls.append(url)
+        return FakeResponse(chunks=[b'--frame\r\n', b'jpeg'])
+
+    monkeypatch.setattr(app.worker_opener, 'open', fake_open)
+
+    response = app.app.test_client().get(f'/video_feed?camera={remote_camera}')
+
+    assert response.data == b'--frame\r\njpeg'
+    assert urls == ['http://door-host:5001/video_feed?camera=0']
+
+
+def test_start_all_cameras_starts_remote_cameras(monkeypatch, remote_camera):
+    requests = []
+
+    def fake_open(req, timeout=None):
+        requests.append(req)
+        return FakeResponse(json.dumps({'success': True, 'camera_id': '0', 'is_running': True}).encode('utf-8'))
+
+    monkeypatch.setattr(app.worker_opener, 'open', fake_open)
+    monkeypatch.setattr(app, 'list_available_cameras', lambda max_failures=5: [])
+
+    response = app.app.test_client().post('/start_all_cameras', json={'confidence': 0.4})
+
+    assert response.get_json()['cameras_started'] == [remote_camera]
+    assert requests[0].full_url == 'http://door-host:5001/start_camera'
+    assert json.loads(requests[0].data) == {'confidence': 0.4, 'camera_id': '0'}
+
+
+def test_worker_redirects_are_not_followed():
+    class RedirectHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(302)
+            self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), RedirectHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            app.worker_opener.open(f"http://127.0.0.1:{server.server_port}/video_feed", timeout=2)
+        assert excinfo.value.code == 302
+    finally:
+        server.shutdown()
+        server.server_close()
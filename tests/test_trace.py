@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def recorder(monkeypatch):
+    monkeypatch.setattr(app, 'trace_enabled', True)
+    app.trace_buffer.clear()
+    yield
+    app.trace_buffer.clear()
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def run_in_thread(name, target):
+    thread = threading.Thread(target=target, name=name)
+    thread.start()
+    thread.join()
+
+
+def thread_rows(trace):
+    return {e['tid']: e['args']['name'] for e in trace['traceEvents'] if e['name'] == 'thread_name'}
+
+
+def test_spans_export_as_chrome_trace():
+    with app.TraceSpan('inference', '0'):
+        pass
+
+    trace = app.export_chrome_trace(10)
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+
+    assert [s['name'] for s in spans] == ['inference']
+    assert spans[0]['args'] == {'camera': '0'}
+    assert spans[0]['dur'] >= 0
+
+
+def test_each_thread_gets_its_own_row():
+    # Sequential threads often reuse the same OS ident
+    for name in ('stream-0', 'stream-1', 'camera-0'):
+        run_in_thread(name, lambda: app.record_span('work', 0.0, 0.001))
+
+    rows = thread_rows(app.export_chrome_trace(1e9))
+
+    assert sorted(rows.values()) == ['camera-0', 'stream-0', 'stream-1']
+
+
+def test_renamed_thread_gets_new_row():
+    def work():
+        app.record_span('work', 0.0, 0.001)
+        threading.current_thread().name = 'stream-5'
+        app.record_span('work', 0.0, 0.001)
+
+    run_in_thread('Thread-1', work)
+
+    assert sorted(thread_rows(app.export_chrome_trace(1e9)).values()) == ['Thread-1', 'stream-5']
+
+
+def test_uncontended_lock_is_not_recorded():
+    lock = threading.Lock()
+
+    with app.TracedLock(lock, 'camera_locks[0]'):
+        assert lock.locked()
+
+    assert not lock.locked()
+    assert len(app.trace_buffer) == 0
+
+
+def test_contended_lock_wait_is_recorded():
+    lock = threading.Lock()
+    traced = app.TracedLock(lock, 'camera_locks[0]')
+    lock.acquire()
+    threading.Timer(0.01, lock.release).start()
+
+    with traced:
+        pass
+
+    name, _, _, start, end, args = app.trace_buffer[-1]
+    assert name == 'lock_wait'
+    assert args == {'lock': 'camera_locks[0]'}
+    assert end - start >= 0.005
+
+
+def test_camera_lock_is_cached_per_camera():
+    app.init_camera_data('trace-cam')
+
+    assert app.camera_lock('trace-cam') is app.camera_lock('trace-cam')
+    assert app.camera_lock('trace-cam').lock is app.camera_locks['trace-cam']
+
+
+def test_disabled_recording_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(app, 'trace_enabled', False)
+
+    with app.TraceSpan('inference', '0'):
+        pass
+    with app.TracedLock(threading.Lock(), 'camera_locks[0]'):
+        pass
+
+    assert len(app.trace_buffer) == 0
+
+
+def test_get_trace_returns_json(client):
+    with app.TraceSpan('cap.read', '0'):
+        pass
+
+    response = client.get('/get_trace?seconds=5')
+
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+    assert any(e['name'] == 'cap.read' for e in json.loads(response.data)['traceEvents'])
+
+
+@pytest.mark.parametrize('seconds', ['abc', '-1', '0', 'nan', 'inf'])
+def test_get_trace_rejects_bad_seconds(client, seconds):
+    response = client.get(f'/get_trace?seconds={seconds}')
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_set_tracing_toggles(client):
+    response = client.post('/set_tracing', json={'enabled': False})
+
+    assert response.status_code == 200
+    assert response.get_json()['enabled'] is False
+    assert app.trace_enabled is False
+
+
+@pytest.mark.parametrize('body', [{'enabled': 'false'}, {'enabled': 0}, {}, {'enabled': True, 'clear': 'yes'}])
+def test_set_tracing_requires_booleans(client, body):
+    response = client.post('/set_tracing', json=body)
+
+    assert response.status_code == 400
+    assert app.trace_enabled is True